@@ -55,7 +55,10 @@ class HealthCheckHandler(BaseHTTPRequestHandler):
             collector = EnhancedCommuteCollectorCloud(verbose=True)
             
             # Run actual departure collection
-            collector.collect_actual_departures()
+            try:
+                collector.collect_actual_departures()
+            finally:
+                collector.close()
             
             logging.info("Collection triggered successfully via /collect endpoint")
         except Exception as e:
@@ -5,17 +5,33 @@ Uses PostgreSQL instead of SQLite for cloud deployment
 """
 
 import requests
-import json
-import psycopg2
+from requests.adapters import HTTPAdapter
+import orjson
 import logging
+import sys
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from typing import Callable, Dict, List, Optional, Tuple
 import time
 import re
-from dataclasses import dataclass
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
 from enum import Enum
 from config_cloud import *
 
+# Local timezone of the commute, used for calendar-day boundaries
+LOCAL_TIMEZONE = ZoneInfo('Europe/Oslo')
+
+# Line to collect, and the Entur line IDs resolved for it per stop place as
+# (monotonic expiry time, line IDs). Entries expire so a long-running scheduler
+# picks up line ID changes after a timetable update; failed lookups are cached
+# briefly as an empty list so an Entur outage doesn't double the request rate
+COMMUTE_LINE_CODE = 'L2'
+LINE_ID_CACHE_TTL_SECONDS = 3600
+LINE_ID_RETRY_SECONDS = 300
+_line_id_cache: Dict[str, Tuple[float, List[str]]] = {}
+
 class CollectionStatus(Enum):
     """Status of departure collection"""
     PENDING = "pending"
@@ -29,7 +45,7 @@ class DepartureStatus(Enum):
     CANCELLED = "cancelled"
     SEVERELY_DELAYED = "severely_delayed"
     UNKNOWN = "unknown"
-@dataclass
+@dataclass(slots=True, frozen=True)
 class CommuteRoute:
     """Represents a specific commute route"""
     route_name: str
@@ -39,8 +55,18 @@ class CommuteRoute:
     target_station_name: str
     final_destination_pattern: str
     direction: str  # 'westbound' or 'eastbound'
+    # Predicate for final_destination_pattern, None when every destination is collected
+    destination_filter: Optional[Callable[[str], object]] = field(init=False, compare=False, repr=False)
 
-@dataclass
+    def __post_init__(self):
+        # Resolve the pattern once per route so matching does no string work per departure
+        object.__setattr__(
+            self, 'destination_filter',
+            destination_matcher(self.final_destination_pattern)
+            if validate_route_pattern(self.final_destination_pattern) else None
+        )
+
+@dataclass(slots=True)
 class PlannedDeparture:
     """Represents a planned train departure"""
     id: Optional[int] = None
@@ -51,6 +77,7 @@ class PlannedDeparture:
     collection_status: CollectionStatus = CollectionStatus.PENDING
     retry_count: int = 0
     last_retry_time: Optional[datetime] = None
+    route_name: str = ""
 
 @dataclass
 class ActualDeparture:
@@ -65,6 +92,47 @@ class ActualDeparture:
     expected_delay_minutes: Optional[int] = None
     classification_reason: Optional[str] = None
 
+@lru_cache(maxsize=4096)
+def parse_entur_timestamp(timestamp: str) -> datetime:
+    """Parse an Entur ISO 8601 timestamp, caching repeated values"""
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+@lru_cache(maxsize=256)
+def compile_destination_pattern(pattern: str) -> re.Pattern:
+    """Compile a final destination pattern once and reuse it for every match"""
+    return re.compile(pattern, re.IGNORECASE)
+
+# Characters that give a destination pattern meaning beyond plain alternation
+DESTINATION_PATTERN_METACHARACTERS = re.compile(r'[.^$*+?{}\[\]\\()]')
+
+@lru_cache(maxsize=256)
+def literal_destinations(pattern: str) -> Optional[frozenset]:
+    """Split a pattern of plain station names into lowercased names, or None if it needs the regex engine"""
+    if DESTINATION_PATTERN_METACHARACTERS.search(pattern):
+        return None
+    return frozenset(name.lower() for name in pattern.split('|'))
+
+@lru_cache(maxsize=256)
+def destination_matcher(pattern: str) -> Callable[[str], object]:
+    """Build the fastest predicate for a final destination pattern, truthy when a destination matches"""
+    names = literal_destinations(pattern)
+    if names is not None:
+        # Plain alternation of station names: a set lookup gives the same result as the regex
+        return lambda destination: destination.lower() in names
+    return compile_destination_pattern(pattern).fullmatch
+
+def validate_route_pattern(pattern: Optional[str]) -> bool:
+    """Check that a final destination pattern filters anything (empty or blank means collect all)"""
+    return bool(pattern) and not pattern.isspace()
+
+def fetch_in_batches(cursor, batch_size: int = 256):
+    """Yield rows from an executed cursor, fetching them batch_size at a time"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
 class EnhancedCommuteCollectorCloud:
     """Enhanced collector for cloud deployment using PostgreSQL"""
     
@@ -77,6 +145,10 @@ class EnhancedCommuteCollectorCloud:
             'Content-Type': 'application/json',
             'ET-Client-Name': CLIENT_NAME
         }
+        # HTTP session so Entur requests reuse keep-alive connections. Sessions are not
+        # thread-safe, so each collector (one per scheduler or /collect thread) owns one
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
         
         # Collection configuration
         self.data_retention_hours = DATA_RETENTION_HOURS
@@ -91,6 +163,10 @@ class EnhancedCommuteCollectorCloud:
         # Load commute routes
         self.routes = self.load_commute_routes()
         
+    def close(self):
+        """Release the pooled Entur HTTP connections held by this collector"""
+        self.session.close()
+        
     def setup_logging(self):
         """Setup logging configuration"""
         level = logging.INFO if self.verbose else logging.WARNING
@@ -106,6 +182,9 @@ class EnhancedCommuteCollectorCloud:
         
     def get_db_connection(self):
         """Get PostgreSQL database connection"""
+        # Imported on first use so importing this module doesn't load libpq
+        import psycopg2
+        
         try:
             if CLOUD_SQL_CONNECTION_NAME:
                 # Use Cloud SQL connector
@@ -181,7 +260,9 @@ class EnhancedCommuteCollectorCloud:
         if not conn:
             return []
             
-        cursor = conn.cursor()
+        # Rows come back as named tuples so fields are read by column name, not position
+        from psycopg2.extras import NamedTupleCursor
+        cursor = conn.cursor(cursor_factory=NamedTupleCursor)
         
         try:
             cursor.execute("""
@@ -194,15 +275,16 @@ class EnhancedCommuteCollectorCloud:
             routes = []
             seen_routes = set()  # Track using (source, target, direction) to detect duplicates
             
-            for row in cursor.fetchall():
-                route_id = row[0]
-                route_name = row[1]
-                source_station_id = row[2]
-                source_station_name = row[3]
-                target_station_id = row[4]
-                target_station_name = row[5]
-                final_destination_pattern = row[6]
-                direction = row[7]
+            for row in fetch_in_batches(cursor):
+                route_id = row.id
+                route_name = row.route_name
+                # Station and direction values repeat across routes, so share one copy of each
+                source_station_id = sys.intern(row.source_station_id)
+                source_station_name = sys.intern(row.source_station_name)
+                target_station_id = sys.intern(row.target_station_id)
+                target_station_name = sys.intern(row.target_station_name)
+                final_destination_pattern = row.final_destination_pattern
+                direction = sys.intern(row.direction)
                 
                 # Empty pattern is allowed - it means collect all L2 departures (no filtering)
                 # Only warn if pattern is None (not set), not if it's empty string
@@ -224,17 +306,26 @@ class EnhancedCommuteCollectorCloud:
                     )
                     continue
                 
-                seen_routes.add(route_key)
+                # A malformed pattern only disables its own route, not the whole load;
+                # its key stays free so a later valid definition is still loaded
+                try:
+                    route = CommuteRoute(
+                        route_name=route_name,
+                        source_station_id=source_station_id,
+                        source_station_name=source_station_name,
+                        target_station_id=target_station_id,
+                        target_station_name=target_station_name,
+                        final_destination_pattern=final_destination_pattern,
+                        direction=direction
+                    )
+                except re.error as e:
+                    self.logger.warning(
+                        f"Skipping route {route_id} ({route_name}): "
+                        f"invalid final_destination_pattern '{final_destination_pattern}': {e}"
+                    )
+                    continue
                 
-                route = CommuteRoute(
-                    route_name=route_name,
-                    source_station_id=source_station_id,
-                    source_station_name=source_station_name,
-                    target_station_id=target_station_id,
-                    target_station_name=target_station_name,
-                    final_destination_pattern=final_destination_pattern,
-                    direction=direction
-                )
+                seen_routes.add(route_key)
                 
                 routes.append(route)
                 self.logger.info(
@@ -262,14 +353,15 @@ class EnhancedCommuteCollectorCloud:
                 "variables": variables or {}
             }
             
-            response = requests.post(
+            response = self.session.post(
                 self.base_url,
                 headers=self.headers,
                 json=payload,
                 timeout=30
             )
             response.raise_for_status()
-            data = response.json()
+            # Parse straight from the response bytes, skipping the str decode
+            data = orjson.loads(response.content)
             
             if 'errors' in data:
                 self.logger.error(f"GraphQL errors: {data['errors']}")
@@ -280,10 +372,51 @@ class EnhancedCommuteCollectorCloud:
         except requests.exceptions.RequestException as e:
             self.logger.error(f"API request failed: {e}")
             return None
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             self.logger.error(f"Failed to parse JSON response: {e}")
             return None
 
+    def get_line_whitelist(self, stop_place_id: str) -> Optional[Dict]:
+        """Get the estimatedCalls whitelist restricting results to the commute line
+        
+        Line IDs are looked up per stop place and cached for LINE_ID_CACHE_TTL_SECONDS.
+        Returns None when they cannot be resolved, in which case all lines are fetched
+        and filtered locally; the lookup is then retried after LINE_ID_RETRY_SECONDS.
+        """
+        now = time.monotonic()
+        cached = _line_id_cache.get(stop_place_id)
+        if cached is None or now >= cached[0]:
+            query = """
+                query($id: String!) {
+                    stopPlace(id: $id) {
+                        quays {
+                            lines {
+                                id
+                                publicCode
+                            }
+                        }
+                    }
+                }
+            """
+            response = self.make_graphql_request(query, {"id": stop_place_id})
+            stop_place = (response.get('data') or {}).get('stopPlace') if response else None
+            if not stop_place:
+                _line_id_cache[stop_place_id] = (now + LINE_ID_RETRY_SECONDS, [])
+                return None
+                
+            line_ids = {
+                line['id']
+                for quay in stop_place.get('quays') or []
+                for line in quay.get('lines') or []
+                if line.get('publicCode') == COMMUTE_LINE_CODE
+            }
+            cached = (now + LINE_ID_CACHE_TTL_SECONDS, sorted(line_ids))
+            _line_id_cache[stop_place_id] = cached
+            self.logger.info(f"Resolved {COMMUTE_LINE_CODE} line IDs for {stop_place_id}: {cached[1]}")
+            
+        line_ids = cached[1]
+        return {"lines": line_ids} if line_ids else None
+
     def collect_planned_departures_daily(self):
         """Collect planned departures for the next 24 hours (run at 03:00 UTC)"""
         self.logger.info("Starting daily planned departure collection")
@@ -307,13 +440,14 @@ class EnhancedCommuteCollectorCloud:
         num_departures = 1000
         
         query = """
-            query($id: String!, $startTime: DateTime!, $numberOfDepartures: Int!) {
+            query($id: String!, $startTime: DateTime!, $numberOfDepartures: Int!, $whiteListed: InputWhiteListed) {
                 stopPlace(id: $id) {
                     id
                     name
                     estimatedCalls(
                         numberOfDepartures: $numberOfDepartures,
                         startTime: $startTime,
+                        whiteListed: $whiteListed,
                         timeRange: 86400
                     ) {
                         aimedDepartureTime
@@ -334,7 +468,8 @@ class EnhancedCommuteCollectorCloud:
         variables = {
             "id": route.source_station_id,
             "startTime": start_time.strftime('%Y-%m-%dT%H:%M:%S.%f%z'),
-            "numberOfDepartures": num_departures
+            "numberOfDepartures": num_departures,
+            "whiteListed": self.get_line_whitelist(route.source_station_id)
         }
         
         response = self.make_graphql_request(query, variables)
@@ -347,27 +482,29 @@ class EnhancedCommuteCollectorCloud:
             
         planned_departures = []
         
-        for call in stop_place.get('estimatedCalls', []):
-            line_code = call['serviceJourney']['line'].get('publicCode', '')
-            
-            # Only process L2 line departures
-            if line_code != 'L2':
-                continue
-                
-            aimed_time = call.get('aimedDepartureTime')
+        # Use the filter compiled with the route
+        # Empty pattern means collect all departures (no filtering)
+        matches_destination = route.destination_filter
+        
+        # Only process L2 line departures
+        line_calls = [
+            call for call in stop_place.get('estimatedCalls', [])
+            if call['serviceJourney']['line'].get('publicCode', '') == COMMUTE_LINE_CODE
+        ]
+        
+        # Project the fields we need into parallel lists once, so the filter loop
+        # works on flat values instead of walking the nested response per call
+        aimed_times = [call.get('aimedDepartureTime') for call in line_calls]
+        service_journey_ids = [call['serviceJourney']['id'] for call in line_calls]
+        final_destinations = [call.get('destinationDisplay', {}).get('frontText', '') for call in line_calls]
+        
+        for aimed_time, service_journey_id, final_destination in zip(aimed_times, service_journey_ids, final_destinations):
             if not aimed_time:
                 continue
                 
-            # Parse departure time
-            departure_time = datetime.fromisoformat(aimed_time.replace('Z', '+00:00'))
-            
-            # Get final destination
-            final_destination = call.get('destinationDisplay', {}).get('frontText', '')
-            
             # Check if this matches our route's final destination pattern
-            # Empty pattern means collect all departures (no filtering)
-            if route.final_destination_pattern and route.final_destination_pattern.strip():
-                if not self.matches_final_destination(final_destination, route.final_destination_pattern):
+            if matches_destination is not None:
+                if not matches_destination(final_destination):
                     self.logger.debug(
                         f"Skipping departure to '{final_destination}' - "
                         f"does not match pattern '{route.final_destination_pattern}' "
@@ -381,10 +518,11 @@ class EnhancedCommuteCollectorCloud:
                     f"(no destination filter for route {route.route_name})"
                 )
                 
+            # Parse departure time only for departures we keep
             planned_departures.append(PlannedDeparture(
-                planned_departure_time=departure_time,
-                service_journey_id=call['serviceJourney']['id'],
-                line_code=line_code,
+                planned_departure_time=parse_entur_timestamp(aimed_time),
+                service_journey_id=service_journey_id,
+                line_code=COMMUTE_LINE_CODE,
                 final_destination=final_destination,
                 collection_status=CollectionStatus.PENDING
             ))
@@ -396,8 +534,9 @@ class EnhancedCommuteCollectorCloud:
         
         Pattern uses pipe (|) as regex alternation operator for multiple destinations.
         Example: "Lysaker|Stabekk" matches trains going to either Lysaker or Stabekk.
+        The whole destination must match, so "Lysaker Station" does not match "Lysaker".
         """
-        return bool(re.search(pattern, destination, re.IGNORECASE))
+        return bool(destination_matcher(pattern)(destination))
 
     def get_collection_frequency(self) -> int:
         """Get collection frequency in minutes based on current time"""
@@ -424,7 +563,9 @@ class EnhancedCommuteCollectorCloud:
         if not conn:
             return []
             
-        cursor = conn.cursor()
+        # Named cursor streams the pending rows from the server in batches
+        cursor = conn.cursor(name='pending_departures_cursor')
+        cursor.itersize = 200
         
         try:
             now = datetime.now(timezone.utc)
@@ -445,7 +586,7 @@ class EnhancedCommuteCollectorCloud:
             """, (cutoff_time, future_window))
             
             departures = []
-            for row in cursor.fetchall():
+            for row in cursor:
                 planned_time = row[1]
                 last_retry = row[7]
                 
@@ -457,7 +598,8 @@ class EnhancedCommuteCollectorCloud:
                     final_destination=row[4],
                     collection_status=CollectionStatus(row[5]),
                     retry_count=row[6],
-                    last_retry_time=last_retry
+                    last_retry_time=last_retry,
+                    route_name=row[8]
                 ))
             
             return departures
@@ -509,11 +651,10 @@ class EnhancedCommuteCollectorCloud:
             return {}
             
         # Group departures by route for efficient API calls
-        route_departures = {}
+        route_departures = defaultdict(list)
         for dep in departures:
-            route_name = self.get_route_name_for_departure(dep.id)
-            if route_name not in route_departures:
-                route_departures[route_name] = []
+            # Route name comes with the pending query; only look it up if it is missing
+            route_name = dep.route_name or self.get_route_name_for_departure(dep.id)
             route_departures[route_name].append(dep)
         
         actual_data = {}
@@ -567,13 +708,14 @@ class EnhancedCommuteCollectorCloud:
         end_time = max_time + timedelta(hours=2)
         
         query = """
-            query($id: String!, $startTime: DateTime!, $numberOfDepartures: Int!) {
+            query($id: String!, $startTime: DateTime!, $numberOfDepartures: Int!, $whiteListed: InputWhiteListed) {
                 stopPlace(id: $id) {
                     id
                     name
                     estimatedCalls(
                         numberOfDepartures: $numberOfDepartures,
                         startTime: $startTime,
+                        whiteListed: $whiteListed,
                         timeRange: 7200
                     ) {
                         aimedDepartureTime
@@ -598,7 +740,8 @@ class EnhancedCommuteCollectorCloud:
         variables = {
             "id": route.source_station_id,
             "startTime": start_time.strftime('%Y-%m-%dT%H:%M:%S.%f%z'),
-            "numberOfDepartures": 200
+            "numberOfDepartures": 200,
+            "whiteListed": self.get_line_whitelist(route.source_station_id)
         }
         
         response = self.make_graphql_request(query, variables)
@@ -634,8 +777,8 @@ class EnhancedCommuteCollectorCloud:
                 # Enhanced monitoring: Log unmatched service journeys for debugging
                 final_dest = call.get('destinationDisplay', {}).get('frontText', '')
                 aimed_time = call.get('aimedDepartureTime', '')
-                if aimed_time:
-                    aimed_dt_log = datetime.fromisoformat(aimed_time.replace('Z', '+00:00'))
+                if aimed_time and self.logger.isEnabledFor(logging.DEBUG):
+                    aimed_dt_log = parse_entur_timestamp(aimed_time)
                     self.logger.debug(f"Unmatched L2 service journey: "
                                     f"time={aimed_dt_log.strftime('%H:%M')} "
                                     f"destination={final_dest} "
@@ -652,9 +795,9 @@ class EnhancedCommuteCollectorCloud:
             if not aimed_time:
                 continue
                 
-            aimed_dt = datetime.fromisoformat(aimed_time.replace('Z', '+00:00'))
-            expected_dt = datetime.fromisoformat(expected_time.replace('Z', '+00:00')) if expected_time else None
-            actual_dt = datetime.fromisoformat(actual_time.replace('Z', '+00:00')) if actual_time else None
+            aimed_dt = parse_entur_timestamp(aimed_time)
+            expected_dt = parse_entur_timestamp(expected_time) if expected_time else None
+            actual_dt = parse_entur_timestamp(actual_time) if actual_time else None
             
             # Calculate delay - ONLY from actual departure times
             # Bug fix: Remove calculation from expected_departure_time to prevent phantom delays
@@ -731,10 +874,9 @@ class EnhancedCommuteCollectorCloud:
         
         # CLASSIFICATION INTEGRATION: Log classification summary
         if actual_data:
-            classification_summary = {}
-            for dep_data in actual_data.values():
-                status = dep_data.departure_status or 'unknown'
-                classification_summary[status] = classification_summary.get(status, 0) + 1
+            classification_summary = Counter(
+                dep_data.departure_status or 'unknown' for dep_data in actual_data.values()
+            )
             
             summary_parts = [f"{status.upper()}: {count}" for status, count in classification_summary.items()]
             self.logger.info(f"Classification summary: {', '.join(summary_parts)}")
@@ -747,6 +889,7 @@ class EnhancedCommuteCollectorCloud:
         if not conn:
             return
             
+        from psycopg2.extras import execute_values
         cursor = conn.cursor()
         
         try:
@@ -754,26 +897,34 @@ class EnhancedCommuteCollectorCloud:
             cursor.execute("SELECT id FROM commute_routes WHERE route_name = %s", (route.route_name,))
             route_id = cursor.fetchone()[0]
             
+            # Look up which of these departures already exist in one query
+            cursor.execute("""
+                SELECT service_journey_id, planned_departure_time FROM planned_departures 
+                WHERE service_journey_id = ANY(%s)
+            """, (list({planned.service_journey_id for planned in planned_departures}),))
+            existing = set(cursor.fetchall())
+            
+            new_rows = []
             for planned in planned_departures:
-                # Check if this departure already exists
-                cursor.execute("""
-                    SELECT id FROM planned_departures 
-                    WHERE service_journey_id = %s AND planned_departure_time = %s
-                """, (planned.service_journey_id, planned.planned_departure_time))
-                
-                if not cursor.fetchone():
-                    cursor.execute("""
-                        INSERT INTO planned_departures 
-                        (route_id, planned_departure_time, service_journey_id, line_code, final_destination, collection_status)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (
-                        route_id,
-                        planned.planned_departure_time,
-                        planned.service_journey_id,
-                        planned.line_code,
-                        planned.final_destination,
-                        planned.collection_status.value
-                    ))
+                key = (planned.service_journey_id, planned.planned_departure_time)
+                if key in existing:
+                    continue
+                existing.add(key)
+                new_rows.append((
+                    route_id,
+                    planned.planned_departure_time,
+                    planned.service_journey_id,
+                    planned.line_code,
+                    planned.final_destination,
+                    planned.collection_status.value
+                ))
+            
+            if new_rows:
+                execute_values(cursor, """
+                    INSERT INTO planned_departures 
+                    (route_id, planned_departure_time, service_journey_id, line_code, final_destination, collection_status)
+                    VALUES %s
+                """, new_rows)
                 
             conn.commit()
         except Exception as e:
@@ -822,20 +973,13 @@ class EnhancedCommuteCollectorCloud:
                                     f"but no actual_departure_time yet")
                 
                 # Update planned departure status
-                # Only increment retry_count for actual collection attempts, not proactive queries
-                if increment_retry:
-                    cursor.execute("""
-                        UPDATE planned_departures 
-                        SET collection_status = %s, retry_count = retry_count + 1, last_retry_time = %s
-                        WHERE id = %s
-                    """, (collection_status, datetime.now(timezone.utc), planned_id))
-                else:
-                    # Update last_retry_time to track when we last checked, but don't increment retry_count
-                    cursor.execute("""
-                        UPDATE planned_departures 
-                        SET collection_status = %s, last_retry_time = %s
-                        WHERE id = %s
-                    """, (collection_status, datetime.now(timezone.utc), planned_id))
+                # Only increment retry_count for actual collection attempts, not proactive queries;
+                # last_retry_time is always updated to track when we last checked
+                cursor.execute("""
+                    UPDATE planned_departures 
+                    SET collection_status = %s, retry_count = retry_count + %s, last_retry_time = %s
+                    WHERE id = %s
+                """, (collection_status, 1 if increment_retry else 0, datetime.now(timezone.utc), planned_id))
                 
                 # Insert actual departure with business intelligence fields
                 cursor.execute("""
@@ -914,17 +1058,17 @@ class EnhancedCommuteCollectorCloud:
         cursor = conn.cursor()
         
         try:
-            # Get stats for today
-            today = datetime.now(timezone.utc).date()
+            # Get stats for today, using Oslo calendar days rather than UTC ones
+            today = datetime.now(LOCAL_TIMEZONE).date()
             
             cursor.execute("""
                 SELECT 
                     COUNT(*) as total,
-                    SUM(CASE WHEN collection_status = 'collected' THEN 1 ELSE 0 END) as collected,
-                    SUM(CASE WHEN collection_status = 'pending' THEN 1 ELSE 0 END) as pending,
-                    SUM(CASE WHEN collection_status = 'failed' THEN 1 ELSE 0 END) as failed
+                    COUNT(*) FILTER (WHERE collection_status = 'collected') as collected,
+                    COUNT(*) FILTER (WHERE collection_status = 'pending') as pending,
+                    COUNT(*) FILTER (WHERE collection_status = 'failed') as failed
                 FROM planned_departures 
-                WHERE DATE(planned_departure_time) = %s
+                WHERE (planned_departure_time AT TIME ZONE 'Europe/Oslo')::date = %s
             """, (today,))
             
             stats = cursor.fetchone()
@@ -1011,10 +1155,12 @@ class EnhancedCommuteCollectorCloud:
                 'severe_delay_rate': 0.0
             }
         
-        on_time = sum(1 for d in departures if d.departure_status == DepartureStatus.ON_TIME.value)
-        delayed = sum(1 for d in departures if d.departure_status == DepartureStatus.DELAYED.value)
-        cancelled = sum(1 for d in departures if d.departure_status == DepartureStatus.CANCELLED.value)
-        severely_delayed = sum(1 for d in departures if d.departure_status == DepartureStatus.SEVERELY_DELAYED.value)
+        # Tally every status in a single pass over the departures
+        status_counts = Counter(d.departure_status for d in departures)
+        on_time = status_counts[DepartureStatus.ON_TIME.value]
+        delayed = status_counts[DepartureStatus.DELAYED.value]
+        cancelled = status_counts[DepartureStatus.CANCELLED.value]
+        severely_delayed = status_counts[DepartureStatus.SEVERELY_DELAYED.value]
         
         return {
             'total_departures': total,
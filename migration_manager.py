@@ -5,14 +5,29 @@ Provides comprehensive migration management capabilities
 """
 
 import argparse
+import string
 import sys
 from datetime import datetime
-from migration_runner import MigrationRunner
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class FilenameTranslation(dict):
+    """str.translate table that maps every character outside [a-z0-9_] to an underscore"""
+    
+    def __missing__(self, codepoint):
+        return '_'
+
+# Translation table for migration filenames (equivalent to re.sub(r'[^a-zA-Z0-9_]', '_', ...) after lower())
+FILENAME_TRANSLATION = FilenameTranslation(
+    (ord(char), char) for char in string.ascii_lowercase + string.digits + '_'
+)
 
 class MigrationManager:
     """CLI tool for managing database migrations"""
     
     def __init__(self):
+        # Imported here so --help and argument errors don't load psycopg2 or fetch secrets
+        from migration_runner import MigrationRunner
         self.runner = MigrationRunner(verbose=True)
     
     def status(self):
@@ -28,8 +43,7 @@ class MigrationManager:
         print()
         
         if status['migrations']:
-            print("Migration Details:")
-            print("-" * 50)
+            lines = ["Migration Details:\n", "-" * 50 + "\n"]
             
             for migration in status['migrations']:
                 status_icon = "✅" if migration['applied'] else "⏳"
@@ -37,9 +51,12 @@ class MigrationManager:
                 
                 applied_at = ""
                 if migration['applied_at']:
-                    applied_at = f" (applied: {migration['applied_at'].strftime('%Y-%m-%d %H:%M:%S')})"
+                    applied_at = f" (applied: {migration['applied_at']:{TIMESTAMP_FORMAT}})"
                 
-                print(f"{status_icon} {migration['version']:>6} | {migration['description']:<30} | Rollback: {rollback_icon}{applied_at}")
+                lines.append(f"{status_icon} {migration['version']:>6} | {migration['description']:<30} | Rollback: {rollback_icon}{applied_at}\n")
+            
+            # Write all rows at once instead of one print per migration
+            sys.stdout.write(''.join(lines))
         else:
             print("No migrations found")
     
@@ -95,9 +112,6 @@ class MigrationManager:
     
     def create_migration(self, name, description=""):
         """Create a new migration file"""
-        import re
-        from pathlib import Path
-        
         # Get next version number
         migrations = self.runner.discover_migrations()
         if migrations:
@@ -107,9 +121,9 @@ class MigrationManager:
             next_version = "001"
         
         # Clean up name for filename
-        clean_name = re.sub(r'[^a-zA-Z0-9_]', '_', name.lower())
+        clean_name = name.lower().translate(FILENAME_TRANSLATION)
         filename = f"{next_version}_{clean_name}.sql"
-        filepath = Path("migrations") / filename
+        filepath = self.runner.migrations_dir / filename
         
         # Create migration file
         migration_content = f"""-- Migration {next_version}: {name}
@@ -134,8 +148,8 @@ class MigrationManager:
             f.write(migration_content)
         
         # Create rollback file
-        rollback_filename = f"{next_version}_{clean_name}_rollback.sql"
-        rollback_filepath = Path("migrations") / rollback_filename
+        self.runner.rollback_dir.mkdir(exist_ok=True)
+        rollback_filepath = self.runner.rollback_dir / filename
         
         rollback_content = f"""-- Rollback script for migration {next_version}_{clean_name}.sql
 -- WARNING: This will permanently delete data
@@ -163,15 +177,15 @@ class MigrationManager:
         print("🔍 Validating Migration Integrity")
         print("=" * 50)
         
-        all_migrations = self.runner.discover_migrations()
-        applied_migrations = self.runner.get_applied_migrations()
+        all_migrations, applied_migrations = self.runner.snapshot()
         
         issues_found = False
         
         for migration in all_migrations:
-            if migration.version in applied_migrations:
-                stored_checksum = applied_migrations[migration.version].get('checksum', '')
-                if stored_checksum and stored_checksum != migration.checksum:
+            applied = applied_migrations.get(migration.version)
+            if applied is not None:
+                stored_checksum = applied.checksum
+                if not self.runner.checksum_matches(migration, stored_checksum):
                     print(f"❌ {migration.version}: File has been modified since application")
                     print(f"   Stored checksum: {stored_checksum}")
                     print(f"   Current checksum: {migration.checksum}")
@@ -192,21 +206,18 @@ class MigrationManager:
         print("📜 Migration History")
         print("=" * 50)
         
-        applied_migrations = self.runner.get_applied_migrations()
+        # Already sorted by applied_at in SQL
+        applied_migrations = self.runner.get_migration_history()
         
         if not applied_migrations:
             print("No migrations have been applied yet")
             return
         
-        # Sort by applied_at
-        sorted_migrations = sorted(
-            applied_migrations.values(),
-            key=lambda x: x['applied_at']
-        )
-        
-        for migration in sorted_migrations:
-            applied_at = migration['applied_at'].strftime('%Y-%m-%d %H:%M:%S')
-            print(f"{migration['version']:>6} | {migration['description']:<30} | {applied_at}")
+        lines = [
+            f"{migration.version:>6} | {migration.description:<30} | {migration.applied_at:{TIMESTAMP_FORMAT}}\n"
+            for migration in applied_migrations
+        ]
+        sys.stdout.write(''.join(lines))
 
 def main():
     parser = argparse.ArgumentParser(
@@ -6,14 +6,30 @@ Handles versioned database migrations with rollback capabilities
 
 import os
 import hashlib
+import json
 import logging
-import psycopg2
+import blake3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 import re
-from migration_config import *
+
+# Bump when the layout or checksum algorithm of the sidecar cache changes
+CHECKSUM_CACHE_VERSION = 2
+
+# Checksums are BLAKE3 digests tagged with a prefix so legacy SHA-256 values
+# (plain hex) can still be recognized. 30 bytes keeps the prefixed hex digest
+# within the VARCHAR(64) schema_migrations.checksum column.
+CHECKSUM_PREFIX = 'b3:'
+CHECKSUM_DIGEST_SIZE = 30
+
+# Migration files up to this size keep their bytes in memory after discovery
+MAX_CACHED_CONTENT_SIZE = 256 * 1024
+
+# Upper bound on concurrent file reads during discovery
+MAX_READ_WORKERS = 8
 
 @dataclass
 class MigrationInfo:
@@ -24,13 +40,28 @@ class MigrationInfo:
     checksum: str
     description: str
     rollback_script: Optional[str] = None
+    content: Optional[bytes] = field(default=None, repr=False)  # File bytes read during discovery (small files only)
+
+@dataclass(slots=True)
+class AppliedMigration:
+    """A row from the schema_migrations tracking table"""
+    version: str
+    filename: str
+    applied_at: Optional[datetime]
+    checksum: Optional[str]
+    description: Optional[str]
 
 class MigrationRunner:
     """Handles database migration execution and rollback"""
     
-    def __init__(self, verbose: bool = False):
+    def __init__(self, verbose: bool = False, config=None):
         self.verbose = verbose
+        # Object providing DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD and
+        # CLOUD_SQL_CONNECTION_NAME; defaults to migration_config on first connection
+        self.config = config
         self.migrations_dir = Path("migrations")
+        self.rollback_dir = self.migrations_dir / "rollback"
+        self.checksum_cache_path = self.migrations_dir / ".cache.json"
         self.setup_logging()
         
     def setup_logging(self):
@@ -48,36 +79,47 @@ class MigrationRunner:
         
     def get_db_connection(self):
         """Get PostgreSQL database connection"""
+        # Imported on first use so CLI startup doesn't pay for loading libpq
+        import psycopg2
+        
+        if self.config is None:
+            # Importing migration_config fetches the credentials from Secret Manager. It
+            # raises when none are available, which stops the command instead of every
+            # connection attempt retrying the lookup and reporting no applied migrations
+            import migration_config
+            self.config = migration_config
+        config = self.config
+        
         try:
             # Check if we're in Cloud Build environment (use direct connection)
-            if os.getenv('GOOGLE_CLOUD_PROJECT') and not os.path.exists(f'/cloudsql/{CLOUD_SQL_CONNECTION_NAME}'):
+            if os.getenv('GOOGLE_CLOUD_PROJECT') and not os.path.exists(f'/cloudsql/{config.CLOUD_SQL_CONNECTION_NAME}'):
                 # Use direct connection for Cloud Build
                 self.logger.info("Using direct database connection for Cloud Build")
                 conn = psycopg2.connect(
-                    host=DB_HOST,
-                    port=DB_PORT,
-                    database=DB_NAME,
-                    user=DB_USER,
-                    password=DB_PASSWORD
+                    host=config.DB_HOST,
+                    port=config.DB_PORT,
+                    database=config.DB_NAME,
+                    user=config.DB_USER,
+                    password=config.DB_PASSWORD
                 )
-            elif CLOUD_SQL_CONNECTION_NAME and os.path.exists(f'/cloudsql/{CLOUD_SQL_CONNECTION_NAME}'):
+            elif config.CLOUD_SQL_CONNECTION_NAME and os.path.exists(f'/cloudsql/{config.CLOUD_SQL_CONNECTION_NAME}'):
                 # Use Cloud SQL connector (for Cloud Run)
                 self.logger.info("Using Cloud SQL socket connection")
                 conn = psycopg2.connect(
-                    host=f'/cloudsql/{CLOUD_SQL_CONNECTION_NAME}',
-                    user=DB_USER,
-                    password=DB_PASSWORD,
-                    database=DB_NAME
+                    host=f'/cloudsql/{config.CLOUD_SQL_CONNECTION_NAME}',
+                    user=config.DB_USER,
+                    password=config.DB_PASSWORD,
+                    database=config.DB_NAME
                 )
             else:
                 # Direct connection (fallback)
                 self.logger.info("Using direct database connection")
                 conn = psycopg2.connect(
-                    host=DB_HOST,
-                    port=DB_PORT,
-                    database=DB_NAME,
-                    user=DB_USER,
-                    password=DB_PASSWORD
+                    host=config.DB_HOST,
+                    port=config.DB_PORT,
+                    database=config.DB_NAME,
+                    user=config.DB_USER,
+                    password=config.DB_PASSWORD
                 )
             return conn
         except Exception as e:
@@ -88,31 +130,79 @@ class MigrationRunner:
         """Discover all migration files in the migrations directory"""
         migrations = []
         
-        if not self.migrations_dir.exists():
+        # Always list the directory, filtering on the entry name before building any Path
+        try:
+            with os.scandir(self.migrations_dir) as entries:
+                file_paths = sorted(
+                    self.migrations_dir / entry.name
+                    for entry in entries
+                    if entry.name.endswith('.sql') and entry.is_file()
+                )
+        except FileNotFoundError:
             self.logger.error(f"Migrations directory not found: {self.migrations_dir}")
             return migrations
+        
+        # The sidecar cache only saves re-hashing files whose mtime and size are unchanged
+        cache = self.load_checksum_cache()
+        cached_files = cache.get('files', {})
             
-        # Find all SQL files matching migration pattern (exclude rollback files)
+        # Find all SQL files matching migration pattern (rollback files live in rollback/)
         pattern = re.compile(r'^(\d{3}[a-z]?)_(.+)\.sql$')
+        current_files = {}
+        rollback_names = self.list_rollback_scripts()
         
-        for file_path in sorted(self.migrations_dir.glob("*.sql")):
-            # Skip rollback files
+        candidates = []
+        for file_path in file_paths:
+            # Old-style rollback files would otherwise match the migration pattern and run
             if file_path.name.endswith('_rollback.sql'):
+                self.logger.warning(
+                    f"Skipping rollback file {file_path.name}: rollback scripts belong in {self.rollback_dir}/"
+                )
                 continue
                 
             match = pattern.match(file_path.name)
             if not match:
                 self.logger.warning(f"Skipping non-migration file: {file_path.name}")
                 continue
-                
+            
+            # Reuse the cached checksum while mtime and size are unchanged
+            stat = file_path.stat()
+            cached = cached_files.get(file_path.name)
+            cached_checksum = None
+            if cached and cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+                cached_checksum = cached['checksum']
+            candidates.append((file_path, match, stat, cached_checksum))
+        
+        # Read every file that needs hashing concurrently
+        contents = self.read_migration_files([
+            file_path for file_path, _, _, cached_checksum in candidates if cached_checksum is None
+        ])
+        
+        for file_path, match, stat, cached_checksum in candidates:
             version = match.group(1)
             description = match.group(2).replace('_', ' ').title()
             
             # Calculate file checksum
-            checksum = self.calculate_checksum(file_path)
+            content = None
+            if cached_checksum is not None:
+                checksum = cached_checksum
+            else:
+                content = contents[file_path]
+                checksum = self.calculate_checksum(content) if content is not None else ""
+                if content is not None and len(content) > MAX_CACHED_CONTENT_SIZE:
+                    content = None
+            
+            if checksum:
+                current_files[file_path.name] = {
+                    'mtime_ns': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                    'checksum': checksum
+                }
             
             # Look for rollback script
-            rollback_script = self.find_rollback_script(file_path)
+            rollback_script = None
+            if file_path.name in rollback_names:
+                rollback_script = self.find_rollback_script(file_path)
             
             migrations.append(MigrationInfo(
                 version=version,
@@ -120,71 +210,180 @@ class MigrationRunner:
                 filepath=str(file_path),
                 checksum=checksum,
                 description=description,
-                rollback_script=rollback_script
+                rollback_script=rollback_script,
+                content=content
             ))
+        
+        if current_files != cached_files:
+            self.save_checksum_cache(current_files)
             
         return migrations
     
-    def calculate_checksum(self, file_path: Path) -> str:
-        """Calculate SHA-256 checksum of a file"""
+    def load_checksum_cache(self) -> Dict:
+        """Load the sidecar checksum cache, or an empty dict if it is missing or stale"""
+        try:
+            with open(self.checksum_cache_path, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        
+        if not isinstance(cache, dict) or cache.get('version') != CHECKSUM_CACHE_VERSION:
+            return {}
+        return cache
+    
+    def save_checksum_cache(self, files: Dict[str, Dict]):
+        """Persist per-file checksums keyed on mtime and size"""
+        try:
+            cache = {
+                'version': CHECKSUM_CACHE_VERSION,
+                'files': files
+            }
+            with open(self.checksum_cache_path, 'w') as f:
+                json.dump(cache, f)
+        except OSError as e:
+            # Read-only deployments simply fall back to hashing every run
+            self.logger.debug(f"Failed to write checksum cache {self.checksum_cache_path}: {e}")
+    
+    def read_migration_file(self, file_path: Path) -> Optional[bytes]:
+        """Read the raw bytes of a migration file"""
         try:
             with open(file_path, 'rb') as f:
-                content = f.read()
-                return hashlib.sha256(content).hexdigest()
+                return f.read()
         except Exception as e:
-            self.logger.error(f"Failed to calculate checksum for {file_path}: {e}")
-            return ""
+            self.logger.error(f"Failed to read migration file {file_path}: {e}")
+            return None
     
-    def find_rollback_script(self, migration_file: Path) -> Optional[str]:
-        """Look for rollback script (e.g., 001_rollback.sql)"""
-        rollback_file = migration_file.parent / f"{migration_file.stem}_rollback.sql"
-        if rollback_file.exists():
-            try:
-                with open(rollback_file, 'r') as f:
-                    return f.read()
-            except Exception as e:
-                self.logger.warning(f"Failed to read rollback script {rollback_file}: {e}")
-        return None
+    def read_migration_files(self, file_paths: List[Path]) -> Dict[Path, Optional[bytes]]:
+        """Read several migration files, overlapping their I/O in a thread pool"""
+        if len(file_paths) <= 1:
+            return {file_path: self.read_migration_file(file_path) for file_path in file_paths}
+        
+        with ThreadPoolExecutor(max_workers=min(MAX_READ_WORKERS, len(file_paths))) as executor:
+            return dict(zip(file_paths, executor.map(self.read_migration_file, file_paths)))
     
-    def get_applied_migrations(self) -> Dict[str, Dict]:
-        """Get list of applied migrations from database"""
+    def calculate_checksum(self, content: bytes) -> str:
+        """Calculate BLAKE3 checksum of migration file contents"""
+        return CHECKSUM_PREFIX + blake3.blake3(content).hexdigest(length=CHECKSUM_DIGEST_SIZE)
+    
+    def checksum_matches(self, migration: MigrationInfo, stored_checksum: Optional[str]) -> bool:
+        """Check a stored checksum against the migration file, accepting legacy SHA-256 values"""
+        if not stored_checksum:
+            return True
+        
+        if stored_checksum.startswith(CHECKSUM_PREFIX):
+            return stored_checksum == migration.checksum
+        
+        # Recorded before the switch to BLAKE3: re-validate with SHA-256
+        content = migration.content
+        if content is None:
+            content = self.read_migration_file(Path(migration.filepath))
+        if content is None or hashlib.sha256(content).hexdigest() != stored_checksum:
+            return False
+        
+        # Store the BLAKE3 checksum so later runs skip the SHA-256 pass
+        self.upgrade_stored_checksum(migration, stored_checksum)
+        return True
+    
+    def upgrade_stored_checksum(self, migration: MigrationInfo, legacy_checksum: str):
+        """Replace a verified legacy SHA-256 checksum with the migration's BLAKE3 checksum"""
         conn = self.get_db_connection()
         if not conn:
-            return {}
+            return
             
         cursor = conn.cursor()
         
         try:
             cursor.execute("""
+                UPDATE schema_migrations 
+                SET checksum = %s
+                WHERE version = %s AND checksum = %s
+            """, (migration.checksum, migration.version, legacy_checksum))
+            conn.commit()
+            self.logger.info(f"Upgraded stored checksum of migration {migration.version} to BLAKE3")
+        except Exception as e:
+            self.logger.warning(f"Failed to upgrade stored checksum of migration {migration.version}: {e}")
+            conn.rollback()
+        finally:
+            conn.close()
+    
+    def list_rollback_scripts(self) -> set:
+        """List rollback script filenames with a single directory scan"""
+        try:
+            with os.scandir(self.rollback_dir) as entries:
+                return {entry.name for entry in entries if entry.is_file()}
+        except FileNotFoundError:
+            return set()
+    
+    def find_rollback_script(self, migration_file: Path) -> Optional[str]:
+        """Read rollback script (e.g., rollback/001_create_delays_table.sql)"""
+        rollback_file = self.rollback_dir / migration_file.name
+        try:
+            with open(rollback_file, 'r') as f:
+                return f.read()
+        except Exception as e:
+            self.logger.warning(f"Failed to read rollback script {rollback_file}: {e}")
+        return None
+    
+    def get_applied_migrations(self, versions: Optional[List[str]] = None) -> Dict[str, AppliedMigration]:
+        """Get applied migrations from database, optionally limited to the given versions"""
+        if versions is None:
+            rows = self.query_applied_migrations("""
                 SELECT version, filename, applied_at, checksum, description
                 FROM schema_migrations
                 ORDER BY version
             """)
+        else:
+            # Let Postgres intersect with the discovered versions so unrelated rows stay on the server
+            rows = self.query_applied_migrations("""
+                SELECT version, filename, applied_at, checksum, description
+                FROM schema_migrations
+                WHERE version = ANY(%s)
+                ORDER BY version
+            """, (list(versions),))
+        return {row.version: row for row in rows}
+    
+    def get_migration_history(self) -> List[AppliedMigration]:
+        """Get applied migrations from database in the order they were applied"""
+        return self.query_applied_migrations("""
+            SELECT version, filename, applied_at, checksum, description
+            FROM schema_migrations
+            ORDER BY applied_at
+        """)
+    
+    def query_applied_migrations(self, query: str, params: Optional[Tuple] = None) -> List[AppliedMigration]:
+        """Stream schema_migrations rows through a server-side cursor"""
+        conn = self.get_db_connection()
+        if not conn:
+            return []
             
-            applied = {}
-            for row in cursor.fetchall():
-                applied[row[0]] = {
-                    'version': row[0],
-                    'filename': row[1],
-                    'applied_at': row[2],
-                    'checksum': row[3],
-                    'description': row[4]
-                }
+        # Named cursor keeps the result set on the server and fetches it in batches
+        cursor = conn.cursor(name='applied_migrations_cursor')
+        cursor.itersize = 500
+        
+        try:
+            cursor.execute(query, params)
             
-            return applied
+            return [AppliedMigration(*row) for row in cursor]
         except Exception as e:
             self.logger.error(f"Failed to get applied migrations: {e}")
-            return {}
+            return []
         finally:
             conn.close()
     
-    def validate_migration_integrity(self, migration: MigrationInfo, applied_info: Dict) -> bool:
+    def snapshot(self) -> Tuple[List[MigrationInfo], Dict[str, AppliedMigration]]:
+        """Discover migration files and load applied migrations in one call"""
+        migrations = self.discover_migrations()
+        versions = {migration.version for migration in migrations}
+        return migrations, self.get_applied_migrations(sorted(versions))
+    
+    def validate_migration_integrity(self, migration: MigrationInfo, applied_info: Dict[str, AppliedMigration]) -> bool:
         """Validate that migration file hasn't been modified since application"""
-        if migration.version not in applied_info:
+        applied = applied_info.get(migration.version)
+        if applied is None:
             return True  # New migration, no validation needed
             
-        stored_checksum = applied_info[migration.version].get('checksum', '')
-        if stored_checksum and stored_checksum != migration.checksum:
+        stored_checksum = applied.checksum
+        if not self.checksum_matches(migration, stored_checksum):
             self.logger.error(f"Migration {migration.version} has been modified since application!")
             self.logger.error(f"Stored checksum: {stored_checksum}")
             self.logger.error(f"Current checksum: {migration.checksum}")
@@ -194,50 +393,73 @@ class MigrationRunner:
     
     def execute_migration(self, migration: MigrationInfo) -> bool:
         """Execute a single migration"""
+        successful, _ = self.execute_migrations([migration])
+        return successful == 1
+    
+    def execute_migrations(self, migrations: List[MigrationInfo]) -> Tuple[int, int]:
+        """Execute migrations in order, stopping at the first failure
+        
+        All migrations share one connection, but each one is committed together with
+        its tracking row before the next starts. A failure rolls back only that
+        migration; the ones before it stay applied and recorded.
+        """
+        if not migrations:
+            return 0, 0
+            
         conn = self.get_db_connection()
         if not conn:
-            return False
+            return 0, 1
             
         cursor = conn.cursor()
+        successful = 0
+        failed = 0
         
         try:
-            self.logger.info(f"Executing migration {migration.version}: {migration.description}")
-            
-            # Read migration file
-            with open(migration.filepath, 'r') as f:
-                migration_sql = f.read()
-            
-            # Split by semicolon and execute each statement
-            statements = [stmt.strip() for stmt in migration_sql.split(';') if stmt.strip()]
-            for statement in statements:
-                if statement:
-                    cursor.execute(statement)
-            
-            # Record migration in tracking table
-            cursor.execute("""
-                INSERT INTO schema_migrations 
-                (version, filename, checksum, rollback_script, description)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (version) DO UPDATE SET
-                    checksum = EXCLUDED.checksum,
-                    rollback_script = EXCLUDED.rollback_script,
-                    description = EXCLUDED.description
-            """, (
-                migration.version,
-                migration.filename,
-                migration.checksum,
-                migration.rollback_script,
-                migration.description
-            ))
-            
-            conn.commit()
-            self.logger.info(f"Migration {migration.version} executed successfully")
-            return True
+            for migration in migrations:
+                self.logger.info(f"Executing migration {migration.version}: {migration.description}")
+                
+                try:
+                    # Reuse the bytes read during discovery, falling back to the file
+                    if migration.content is not None:
+                        migration_sql = migration.content.decode('utf-8')
+                    else:
+                        with open(migration.filepath, 'r') as f:
+                            migration_sql = f.read()
+                    
+                    # Split by semicolon and execute each statement
+                    statements = [stmt.strip() for stmt in migration_sql.split(';') if stmt.strip()]
+                    for statement in statements:
+                        if statement:
+                            cursor.execute(statement)
+                    
+                    # Record migration in tracking table
+                    cursor.execute("""
+                        INSERT INTO schema_migrations 
+                        (version, filename, checksum, rollback_script, description)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (version) DO UPDATE SET
+                            checksum = EXCLUDED.checksum,
+                            rollback_script = EXCLUDED.rollback_script,
+                            description = EXCLUDED.description
+                    """, (
+                        migration.version,
+                        migration.filename,
+                        migration.checksum,
+                        migration.rollback_script,
+                        migration.description
+                    ))
+                    
+                    conn.commit()
+                except Exception as e:
+                    self.logger.error(f"Migration {migration.version} failed: {e}")
+                    conn.rollback()
+                    failed = 1
+                    break  # Stop on first failure
+                
+                successful += 1
+                self.logger.info(f"Migration {migration.version} executed successfully")
             
-        except Exception as e:
-            self.logger.error(f"Migration {migration.version} failed: {e}")
-            conn.rollback()
-            return False
+            return successful, failed
         finally:
             conn.close()
     
@@ -290,19 +512,16 @@ class MigrationRunner:
         finally:
             conn.close()
     
-    def run_pending_migrations(self) -> Tuple[int, int]:
+    def run_pending_migrations(self, snapshot: Optional[Tuple[List[MigrationInfo], Dict[str, AppliedMigration]]] = None) -> Tuple[int, int]:
         """Run all pending migrations"""
         self.logger.info("Checking for pending migrations...")
         
-        # Discover all migrations
-        all_migrations = self.discover_migrations()
+        # Discover all migrations and get applied migrations
+        all_migrations, applied_migrations = snapshot or self.snapshot()
         if not all_migrations:
             self.logger.warning("No migration files found")
             return 0, 0
         
-        # Get applied migrations
-        applied_migrations = self.get_applied_migrations()
-        
         # Find pending migrations
         pending_migrations = []
         for migration in all_migrations:
@@ -321,22 +540,11 @@ class MigrationRunner:
         self.logger.info(f"Found {len(pending_migrations)} pending migrations")
         
         # Execute pending migrations
-        successful = 0
-        failed = 0
-        
-        for migration in pending_migrations:
-            if self.execute_migration(migration):
-                successful += 1
-            else:
-                failed += 1
-                break  # Stop on first failure
-        
-        return successful, failed
+        return self.execute_migrations(pending_migrations)
     
-    def get_migration_status(self) -> Dict:
+    def get_migration_status(self, snapshot: Optional[Tuple[List[MigrationInfo], Dict[str, AppliedMigration]]] = None) -> Dict:
         """Get current migration status"""
-        all_migrations = self.discover_migrations()
-        applied_migrations = self.get_applied_migrations()
+        all_migrations, applied_migrations = snapshot or self.snapshot()
         
         status = {
             'total_migrations': len(all_migrations),
@@ -346,13 +554,14 @@ class MigrationRunner:
         }
         
         for migration in all_migrations:
-            is_applied = migration.version in applied_migrations
+            applied = applied_migrations.get(migration.version)
+            is_applied = applied is not None
             status['migrations'].append({
                 'version': migration.version,
                 'filename': migration.filename,
                 'description': migration.description,
                 'applied': is_applied,
-                'applied_at': applied_migrations.get(migration.version, {}).get('applied_at'),
+                'applied_at': applied.applied_at if applied else None,
                 'has_rollback': migration.rollback_script is not None
             })
             
@@ -363,6 +572,7 @@ class MigrationRunner:
 
 if __name__ == "__main__":
     import argparse
+    import sys
     
     parser = argparse.ArgumentParser(description='Database Migration Runner')
     parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose logging')
@@ -376,16 +586,21 @@ if __name__ == "__main__":
     
     if args.status:
         status = runner.get_migration_status()
-        print(f"Migration Status:")
-        print(f"  Total migrations: {status['total_migrations']}")
-        print(f"  Applied migrations: {status['applied_migrations']}")
-        print(f"  Pending migrations: {status['pending_migrations']}")
-        print()
+        lines = [
+            "Migration Status:\n",
+            f"  Total migrations: {status['total_migrations']}\n",
+            f"  Applied migrations: {status['applied_migrations']}\n",
+            f"  Pending migrations: {status['pending_migrations']}\n",
+            "\n"
+        ]
         
         for migration in status['migrations']:
             status_str = "✓" if migration['applied'] else "○"
             rollback_str = " (rollback available)" if migration['has_rollback'] else ""
-            print(f"  {status_str} {migration['version']}: {migration['description']}{rollback_str}")
+            lines.append(f"  {status_str} {migration['version']}: {migration['description']}{rollback_str}\n")
+        
+        # Write the whole report at once instead of one print per migration
+        sys.stdout.write(''.join(lines))
     
     elif args.migrate:
         successful, failed = runner.run_pending_migrations()
@@ -0,0 +1,8 @@
+-- Migration 011: Add Planned Departures Local Date Index
+-- Daily statistics filter planned departures by their Europe/Oslo calendar day.
+-- Index the same expression so those lookups become index range scans.
+
+CREATE INDEX IF NOT EXISTS idx_planned_departures_local_date
+    ON planned_departures (((planned_departure_time AT TIME ZONE 'Europe/Oslo')::date), route_id);
+
+COMMENT ON INDEX idx_planned_departures_local_date IS 'Europe/Oslo calendar day of planned departures, used for daily statistics';
@@ -0,0 +1,14 @@
+-- Migration 012: Enforce Collection Status Not Null
+-- collection_status and retry_count already default to 'pending' and 0,
+-- so backfill any legacy NULLs and make the columns NOT NULL.
+
+-- Backfill rows written before the defaults applied
+UPDATE planned_departures SET collection_status = 'pending' WHERE collection_status IS NULL;
+UPDATE planned_departures SET retry_count = 0 WHERE retry_count IS NULL;
+
+-- Enforce the defaults
+ALTER TABLE planned_departures 
+ALTER COLUMN collection_status SET DEFAULT 'pending',
+ALTER COLUMN collection_status SET NOT NULL,
+ALTER COLUMN retry_count SET DEFAULT 0,
+ALTER COLUMN retry_count SET NOT NULL;
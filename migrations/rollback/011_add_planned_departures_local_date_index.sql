@@ -0,0 +1,4 @@
+-- Rollback script for migration 011_add_planned_departures_local_date_index.sql
+-- This will drop the local date index on planned_departures
+
+DROP INDEX IF EXISTS idx_planned_departures_local_date;
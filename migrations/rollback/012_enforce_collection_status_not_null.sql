@@ -0,0 +1,6 @@
+-- Rollback script for migration 012_enforce_collection_status_not_null.sql
+-- This will allow NULL values again (defaults from migration 003 are kept)
+
+ALTER TABLE planned_departures 
+ALTER COLUMN collection_status DROP NOT NULL,
+ALTER COLUMN retry_count DROP NOT NULL;